@@ -38,7 +38,11 @@ async def lifespan(app: FastAPI) -> ty.AsyncGenerator[None, None]:
     app.state.cache = cache = CacheService(config.redis_url)
 
     # Initialize the database repository.
-    app.state.repo = repo = Repository(config.database_url, **config.database_config)
+    app.state.repo = repo = Repository(
+        config.database_url,
+        purge_batch_size=config.purge_batch_size,
+        **config.database_config,
+    )
 
     # Initialize the blob bucket.
     async with blob.start_session(config.production) as session:
@@ -44,7 +44,11 @@ async def main(index: int = 1) -> None:
     queue = QueueService(config.redis_url)
 
     # Initialize the database repository.
-    repo = Repository(config.database_url, **config.database_config)
+    repo = Repository(
+        config.database_url,
+        purge_batch_size=config.purge_batch_size,
+        **config.database_config,
+    )
 
     # Initialize the compute worker.
     worker = ComputeWorker(
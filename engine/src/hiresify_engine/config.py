@@ -64,6 +64,9 @@ class AppConfig(BaseSettings):
     # The TTL for a presigned download URL (s).
     presigned_ttl: int = 300
 
+    # The number of rows deleted per transaction when purging expired rows.
+    purge_batch_size: int = Field(default=10000, gt=0)
+
     # The redis server URL.
     redis_url: str = ""
 
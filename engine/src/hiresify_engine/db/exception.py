@@ -11,24 +11,26 @@ import typing as ty
 class EntityNotFoundError(Exception):
     """Raised when a database entity was not found."""
 
+    # The message template filled in with the entity name and its identifiers.
+    _template = "{} with {} was not found."
+
     def __init__(self, klass: type, **identifiers: ty.Any) -> None:
         """Initialize a new instance of EntityNotFoundError."""
         super().__init__(
-            f"{klass.__name__} with "
-            f"{' '.join(f'{key}={value}' for key, value in identifiers.items())} "
-            "was not found.",
+            self._template.format(klass.__name__, _format_identifiers(identifiers)),
         )
 
 
 class EntityConflictError(Exception):
     """Raised for a conflict with an existing database entity."""
 
+    # The message template filled in with the entity name and its identifiers.
+    _template = "{} with {} conflicts with an existing entity."
+
     def __init__(self, klass: type, **identifiers: ty.Any) -> None:
         """Initialize a new instance of EntityConflictError."""
         super().__init__(
-            f"{klass.__name__} with "
-            f"{' '.join(f'{key}={value}' for key, value in identifiers.items())} "
-            "conflicts with an existing entity.",
+            self._template.format(klass.__name__, _format_identifiers(identifiers)),
         )
 
 
@@ -46,3 +48,8 @@ class UploadNotFoundError(Exception):
     def __init__(self, blob_uid: str) -> None:
         """Initialize a new instance of UploadNotFoundError."""
         super().__init__(f"There is no upload for {blob_uid=}.")
+
+
+def _format_identifiers(identifiers: dict[str, ty.Any]) -> str:
+    """Format the identifiers of a database entity for an error message."""
+    return " ".join(f"{key}={value}" for key, value in identifiers.items())
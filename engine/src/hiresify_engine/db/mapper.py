@@ -3,17 +3,23 @@
 # This file is not licensed for use, modification, or distribution without
 # explicit written permission from the copyright holder.
 
-"""Provide mapper functions to convert ORM objects to domain ones."""
+"""Provide mapper functions to convert ORM objects to domain ones.
+
+The mappers also accept result rows selecting the same columns, which the
+read-only queries use to skip building ORM objects.
+"""
 
 import typing as ty
 
+from sqlalchemy import Row
+
 from hiresify_engine.model import Blob, ComputeJob, JWTToken, Upload, User
 from hiresify_engine.util import parse_blob_key
 
 from .model import BlobORM, ComputeJobORM, RefreshTokenORM, UploadORM, UserORM
 
 
-def to_blob(obj: BlobORM) -> Blob:
+def to_blob(obj: BlobORM | Row) -> Blob:
     """Convert a blob ORM object to a domain one."""
     _, _, mime_type = parse_blob_key(obj.blob_key)
 
@@ -26,7 +32,7 @@ def to_blob(obj: BlobORM) -> Blob:
     )
 
 
-def to_token(obj: RefreshTokenORM, **kwargs: ty.Any) -> JWTToken:
+def to_token(obj: RefreshTokenORM | Row, **kwargs: ty.Any) -> JWTToken:
     """Convert a refresh token ORM object to a domain one."""
     return JWTToken(
         issued_at=obj.issued_at,
@@ -37,7 +43,7 @@ def to_token(obj: RefreshTokenORM, **kwargs: ty.Any) -> JWTToken:
     )
 
 
-def to_upload(obj: UploadORM) -> Upload:
+def to_upload(obj: UploadORM | Row) -> Upload:
     """Convert an upload ORM object to a domain one."""
     return Upload(
         uid=obj.uid,
@@ -47,12 +53,12 @@ def to_upload(obj: UploadORM) -> Upload:
     )
 
 
-def to_user(obj: UserORM) -> User:
+def to_user(obj: UserORM | Row) -> User:
     """Convert a user ORM object to a domain one."""
     return User(uid=obj.uid, username=obj.username, password=obj.password)
 
 
-def to_job(obj: ComputeJobORM) -> ComputeJob:
+def to_job(obj: ComputeJobORM | Row) -> ComputeJob:
     """Convert a compute job ORM object to a domain one."""
     return ComputeJob(
         uid=obj.uid,
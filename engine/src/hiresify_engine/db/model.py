@@ -5,10 +5,18 @@
 
 """Define the database schema."""
 
+import re
 from datetime import UTC, datetime
 from uuid import uuid4
 
-from sqlalchemy import DateTime, ForeignKey, String, TypeDecorator
+from sqlalchemy import (
+    DateTime,
+    ForeignKey,
+    Index,
+    LargeBinary,
+    String,
+    TypeDecorator,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -30,6 +38,41 @@ class AwareDateTime(TypeDecorator):
         return value
 
 
+class BinaryUID(TypeDecorator):
+    """A SQLAlchemy type that stores a hex UID as its 16 raw bytes.
+
+    The UID stays a hex string in Python while the index holds half the bytes. Only
+    canonical UIDs of 32 lowercase hex characters are accepted, so that every UID
+    has exactly one stored form.
+    """
+
+    impl = LargeBinary(16)
+
+    cache_ok = True
+
+    # The pattern of a canonical hex UID as generated by uuid4().hex.
+    _pattern = re.compile(r"[0-9a-f]{32}")
+
+    @classmethod
+    def is_canonical(cls, value: str) -> bool:
+        """Check if the given value is a canonical hex UID."""
+        return cls._pattern.fullmatch(value) is not None
+
+    def process_bind_param(self, value: str | None, dialect) -> bytes | None:
+        """Process the bound value to be the raw bytes of the hex UID."""
+        if value is None:
+            return None
+
+        if not self.is_canonical(value):
+            raise ValueError(f"{value=} is not a 32-character lowercase hex UID.")
+
+        return bytes.fromhex(value)
+
+    def process_result_value(self, value: bytes | None, dialect) -> str | None:
+        """Process the result value to be the hex UID of the raw bytes."""
+        return None if value is None else value.hex()
+
+
 class Base(DeclarativeBase):
     """The base for all database models to inherit from."""
 
@@ -73,18 +116,23 @@ class RefreshTokenORM(Base):
 
     __tablename__ = "refresh_token"
 
+    # The user's active tokens are looked up by the user ID and the revoked flag.
+    __table_args__ = (Index("ix_refresh_token_user_id_revoked", "user_id", "revoked"),)
+
     id: Mapped[int] = mapped_column(primary_key=True)
 
     #: The UID of a refresh token, used externally.
     uid: Mapped[str] = mapped_column(
-        String(32), default=lambda: uuid4().hex, unique=True,
+        BinaryUID(), default=lambda: uuid4().hex, unique=True,
     )
 
     #: The date and time when the token was issued.
     issued_at: Mapped[datetime] = mapped_column(AwareDateTime(), nullable=False)
 
     #: The date and time when the token was set to expire.
-    expire_at: Mapped[datetime] = mapped_column(AwareDateTime(), nullable=False)
+    expire_at: Mapped[datetime] = mapped_column(
+        AwareDateTime(), index=True, nullable=False,
+    )
 
     #: A boolean flag for whether this token has been revoked.
     revoked: Mapped[bool] = mapped_column(default=False, nullable=False)
@@ -127,10 +175,12 @@ class BlobORM(Base):
     created_at: Mapped[datetime] = mapped_column(AwareDateTime(), nullable=False)
 
     #: The date and time when the blob is valid through.
-    valid_thru: Mapped[datetime] = mapped_column(AwareDateTime(), nullable=False)
+    valid_thru: Mapped[datetime] = mapped_column(
+        AwareDateTime(), index=True, nullable=False,
+    )
 
     #: The user ID that this blob is associated with.
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), index=True)
 
     # Each blob belongs to one user.
     user: Mapped[UserORM] = relationship(back_populates="blobs")
@@ -149,7 +199,7 @@ class UploadORM(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
 
     #: The UID of this upload generated by the blob service.
-    uid: Mapped[str] = mapped_column(String(128), nullable=False)
+    uid: Mapped[str] = mapped_column(String(128), index=True, nullable=False)
 
     #: The blob key to identify the blob in the blob store.
     blob_key: Mapped[str] = mapped_column(String(256), nullable=False)
@@ -158,10 +208,12 @@ class UploadORM(Base):
     created_at: Mapped[datetime] = mapped_column(AwareDateTime(), nullable=False)
 
     #: The date and time when the upload is valid through.
-    valid_thru: Mapped[datetime] = mapped_column(AwareDateTime(), nullable=False)
+    valid_thru: Mapped[datetime] = mapped_column(
+        AwareDateTime(), index=True, nullable=False,
+    )
 
     #: The user ID that this upload is associated with.
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), index=True)
 
     # Each upload belongs to one user.
     user: Mapped[UserORM] = relationship(back_populates="uploads")
@@ -194,7 +246,7 @@ class ComputeJobORM(Base):
     status: Mapped[str] = mapped_column(String(8), default="created", nullable=False)
 
     #: The blob ID that this job is associated with.
-    blob_id: Mapped[int] = mapped_column(ForeignKey("blob.id"))
+    blob_id: Mapped[int] = mapped_column(ForeignKey("blob.id"), index=True)
 
     # Each job belongs to one blob.
     blob: Mapped[BlobORM] = relationship(back_populates="jobs")
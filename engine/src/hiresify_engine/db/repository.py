@@ -5,50 +5,408 @@
 
 """Export the repository layer around the database."""
 
-import contextlib
+import asyncio
 import typing as ty
 from collections import abc
+from contextlib import asynccontextmanager
 from datetime import UTC, datetime, timedelta
 
-from sqlalchemy import and_, delete, func, select
+from sqlalchemy import (
+    Connection,
+    CursorResult,
+    Insert,
+    Select,
+    String,
+    Table,
+    bindparam,
+    delete,
+    func,
+    insert,
+    inspect,
+    literal,
+    select,
+    update,
+)
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import selectinload, with_loader_criteria
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import joinedload
 
 from hiresify_engine.model import Blob, ComputeJob, JobStatus, JWTToken, Upload, User
 
 from .exception import EntityConflictError, EntityNotFoundError
 from .mapper import to_blob, to_job, to_token, to_upload, to_user
-from .model import Base, BlobORM, ComputeJobORM, RefreshTokenORM, UploadORM, UserORM
+from .model import (
+    Base,
+    BinaryUID,
+    BlobORM,
+    ComputeJobORM,
+    RefreshTokenORM,
+    UploadORM,
+    UserORM,
+)
+
+# The default connection pool configuration for server-backed databases.
+_pool_configs: dict[str, ty.Any] = dict(
+    max_overflow=40,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    pool_size=20,
+)
+
+
+def _group_tables() -> list[list[Table]]:
+    """Group the tables into levels that can be purged one level after another.
+
+    A table only references tables at lower levels, so the tables at one level are
+    independent of each other and the levels are purged from the highest down.
+    """
+    depths: dict[Table, int] = {}
+
+    for table in Base.metadata.sorted_tables:
+        parents = [fk.column.table for fk in table.foreign_keys]
+        depths[table] = 1 + max((depths[parent] for parent in parents), default=-1)
+
+    levels: list[list[Table]] = [[] for _ in range(max(depths.values()) + 1)]
+
+    for table, depth in depths.items():
+        levels[depth].append(table)
+
+    return levels[::-1]
+
+
+# The table levels in the order of being purged.
+_table_levels = _group_tables()
+
+
+def _upgrade_token_uid(conn: Connection) -> None:
+    """Convert the refresh token UIDs of an existing table from hex strings to bytes.
+
+    create_all leaves alone the VARCHAR column of a table created before the UIDs
+    were stored as raw bytes, so it is converted in place. Only PostgreSQL is
+    upgraded, as the SQLite databases are for testing and always start empty.
+    """
+    inspector = inspect(conn)
+
+    if conn.dialect.name != "postgresql" or not inspector.has_table("refresh_token"):
+        return
+
+    columns = inspector.get_columns("refresh_token")
+
+    if any(c["name"] == "uid" and isinstance(c["type"], String) for c in columns):
+        conn.exec_driver_sql(
+            "ALTER TABLE refresh_token "
+            "ALTER COLUMN uid TYPE bytea USING decode(uid, 'hex')",
+        )
+
+
+def _create_indexes(conn: Connection) -> None:
+    """Create the declared indexes that are missing from the database.
+
+    create_all skips the tables that already exist, and the indexes along with them,
+    so the indexes added to an existing table are only created here.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+# The columns read by the mappers when an ORM object is not needed.
+_user_columns = (UserORM.uid, UserORM.username, UserORM.password)
+
+_token_columns = (
+    RefreshTokenORM.uid,
+    RefreshTokenORM.issued_at,
+    RefreshTokenORM.expire_at,
+    RefreshTokenORM.revoked,
+)
+
+_blob_columns = (
+    BlobORM.uid,
+    BlobORM.blob_key,
+    BlobORM.file_name,
+    BlobORM.created_at,
+    BlobORM.valid_thru,
+)
+
+_upload_columns = (
+    UploadORM.uid,
+    UploadORM.blob_key,
+    UploadORM.created_at,
+    UploadORM.valid_thru,
+)
+
+_job_columns = (
+    ComputeJobORM.uid,
+    ComputeJobORM.requested_at,
+    ComputeJobORM.completed_at,
+    ComputeJobORM.status,
+)
+
+# The statements below are built once and executed with bound parameters.
+
+_select_user = select(*_user_columns).where(
+    UserORM.username == bindparam("username"),
+)
+
+_select_user_id = select(UserORM.id).where(UserORM.uid == bindparam("user_uid"))
+
+_select_token = (
+    select(RefreshTokenORM)
+    .options(joinedload(RefreshTokenORM.user, innerjoin=True))
+    .where(RefreshTokenORM.uid == bindparam("token_uid"))
+)
+
+_select_blob_id = select(BlobORM.id).where(BlobORM.uid == bindparam("blob_uid"))
+
+_update_password = (
+    update(UserORM)
+    .where(UserORM.username == bindparam("user_name"))
+    .values(password=bindparam("hashed_password"))
+)
+
+_delete_user = delete(UserORM).where(UserORM.username == bindparam("username"))
+
+_delete_user_rows = [
+    delete(ComputeJobORM).where(
+        ComputeJobORM.blob_id.in_(
+            select(BlobORM.id).where(
+                BlobORM.user_id == _select_user.with_only_columns(
+                    UserORM.id,
+                ).scalar_subquery(),
+            ),
+        ),
+    ),
+    *(
+        delete(klass).where(
+            klass.user_id
+            == _select_user.with_only_columns(UserORM.id).scalar_subquery(),
+        )
+        for klass in (BlobORM, RefreshTokenORM, UploadORM)
+    ),
+]
+
+_select_tokens = (
+    select(*_token_columns)
+    .join(RefreshTokenORM.user)
+    .where(UserORM.uid == bindparam("user_uid"))
+)
+
+_revoke_token = (
+    update(RefreshTokenORM)
+    .where(RefreshTokenORM.uid == bindparam("token_uid"))
+    .values(revoked=True)
+)
+
+_revoke_tokens = (
+    update(RefreshTokenORM)
+    .where(
+        RefreshTokenORM.user_id == _select_user_id.scalar_subquery(),
+        RefreshTokenORM.revoked.is_(False),
+    )
+    .values(revoked=True)
+)
+
+_select_blob = select(*_blob_columns).where(
+    BlobORM.uid == bindparam("blob_uid"),
+    BlobORM.user.has(UserORM.uid == bindparam("user_uid")),
+)
+
+_select_blobs = (
+    select(*_blob_columns)
+    .join(BlobORM.user)
+    .where(UserORM.uid == bindparam("user_uid"))
+)
+
+_delete_blob = delete(BlobORM).where(BlobORM.uid == bindparam("blob_uid"))
+
+_delete_blobs = delete(BlobORM).where(
+    BlobORM.user_id == _select_user_id.scalar_subquery(),
+)
+
+_select_upload = select(*_upload_columns).where(
+    UploadORM.uid == bindparam("upload_id"),
+    UploadORM.user.has(UserORM.uid == bindparam("user_uid")),
+)
+
+_select_uploads = (
+    select(*_upload_columns)
+    .join(UploadORM.user)
+    .where(UserORM.uid == bindparam("user_uid"))
+)
+
+_delete_upload = delete(UploadORM).where(UploadORM.uid == bindparam("upload_id"))
+
+_finish_upload = (
+    delete(UploadORM)
+    .where(
+        UploadORM.uid == bindparam("upload_id"),
+        UploadORM.user_id == _select_user_id.scalar_subquery(),
+    )
+    .returning(UploadORM.blob_key)
+)
+
+_select_blob_key = (
+    select(BlobORM.blob_key)
+    .join_from(ComputeJobORM, ComputeJobORM.blob)
+    .where(ComputeJobORM.uid == bindparam("job_id"))
+)
+
+_select_result_key = select(ComputeJobORM.blob_key).where(
+    ComputeJobORM.uid == bindparam("job_id"),
+)
+
+_select_jobs = (
+    select(*_job_columns)
+    .join(ComputeJobORM.blob)
+    .where(BlobORM.uid == bindparam("blob_uid"))
+)
+
+_select_latest_job = select(*_job_columns).where(
+    ComputeJobORM.blob.has(BlobORM.uid == bindparam("blob_uid")),
+    ComputeJobORM.requested_at == (
+        select(func.max(ComputeJobORM.requested_at))
+        .where(ComputeJobORM.blob.has(BlobORM.uid == bindparam("blob_uid")))
+        .scalar_subquery()
+    ),
+)
+
+_update_job = (
+    update(ComputeJobORM)
+    .where(ComputeJobORM.uid == bindparam("job_id"))
+    .values(status=bindparam("job_status"), blob_key=bindparam("result_key"))
+)
+
+
+def _get_cutoff(retention_days: int, now: datetime | None) -> datetime:
+    """Get the time before which expired rows are purged.
+
+    Callers purging several tables in one go can pass the same `now` to all of them.
+    """
+    return (now or datetime.now(UTC)) - timedelta(days=retention_days)
+
+
+def _check_batch_size(batch_size: int) -> int:
+    """Check that a purge batch size is positive, or a purge would never finish."""
+    if batch_size <= 0:
+        raise ValueError(f"{batch_size=} must be positive.")
+
+    return batch_size
+
+
+def _check_token_uids(items: abc.Iterable[dict[str, ty.Any]]) -> None:
+    """Check that the refresh token UIDs given by the caller can be stored."""
+    for item in items:
+        if (uid := item.get("uid")) is not None and not BinaryUID.is_canonical(uid):
+            raise ValueError(f"{uid=} is not a 32-character lowercase hex UID.")
+
+
+async def _insert_many(
+    db: AsyncSession,
+    klass: type[Base],
+    user_id: int,
+    items: abc.Sequence[dict[str, ty.Any]],
+) -> abc.Sequence[ty.Any]:
+    """Insert a row of `klass` per item for the given user ID in a single statement.
+
+    The inserted ORM objects are returned in the order of `items`.
+    """
+    if not items:
+        return []
+
+    stmt = insert(klass).returning(klass, sort_by_parameter_order=True)
+    params = [dict(item, user_id=user_id) for item in items]
+    return (await db.scalars(stmt, params)).all()
+
+
+def _insert_from(
+    klass: type[Base], parent_id: Select, foreign_key: str, **values: ty.Any,
+) -> Insert:
+    """Build an INSERT of `klass` that resolves its parent ID in the same statement.
+
+    No row is inserted (and nothing is returned) when `parent_id` selects no row.
+    """
+    columns = [
+        literal(value, getattr(klass, key).type) for key, value in values.items()
+    ]
+    select_stmt = parent_id.add_columns(*columns)
+
+    return (
+        insert(klass)
+        .from_select([foreign_key, *values], select_stmt)
+        .returning(klass)
+    )
 
 
 class Repository:
     """A wrapper class providing APIs to manage the database."""
 
-    def __init__(self, url: str, **configs: ty.Any) -> None:
+    def __init__(
+        self, url: str, *, purge_batch_size: int = 10000, **configs: ty.Any,
+    ) -> None:
         """Initialize a new instance of Repository."""
+        self._purge_batch_size = _check_batch_size(purge_batch_size)
+
+        # Only one bulk purge runs at a time so that the sweeps do not contend.
+        self._purge_lock = asyncio.Lock()
+
+        # The defaults only apply to the queue pool of a server-backed database, so
+        # they are skipped for SQLite and for any pool class chosen by the caller.
+        if not url.startswith("sqlite") and "poolclass" not in configs:
+            configs = _pool_configs | configs
+
         self._engine = create_async_engine(url, **configs)
         self._create_session = async_sessionmaker(
             bind=self._engine, expire_on_commit=False,
         )
 
-    @contextlib.asynccontextmanager
-    async def session(self) -> abc.AsyncGenerator[AsyncSession, None]:
-        """Provide an async context-managed database session."""
-        async with self._create_session() as session:
-            yield session
+    @property
+    def engine(self) -> AsyncEngine:
+        """Get the underlying database engine."""
+        return self._engine
+
+    def session(self) -> AsyncSession:
+        """Provide an async context-managed database session.
+
+        The session can be passed to the repository methods to run them in a single
+        transaction, which the caller then owns and has to commit.
+        """
+        return self._create_session()
 
     async def init_schema(self) -> None:
-        """Initialize all the tables based on a pre-defined schema."""
+        """Initialize all the tables based on a pre-defined schema.
+
+        The tables that already exist are upgraded in place and get the indexes they
+        are missing.
+        """
         async with self._engine.begin() as conn:
+            await conn.run_sync(_upgrade_token_uid)
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_create_indexes)
 
     async def purge_tables(self) -> None:
-        """Purge all the tables (delete all the rows)."""
-        async with self.session() as session:
-            async with session.begin():
-                for table in reversed(Base.metadata.sorted_tables):
-                    await session.execute(table.delete())
+        """Purge all the tables (delete all the rows).
+
+        Independent tables are purged concurrently, each over its own connection,
+        except on SQLite that only allows for a single writer at a time. Outside SQLite
+        each table is purged in its own transaction, so a failure partway through
+        leaves the purge incomplete.
+        """
+        async with self._purge_lock:
+            if self._engine.dialect.name == "sqlite":
+                async with self.session() as session:
+                    async with session.begin():
+                        for table in reversed(Base.metadata.sorted_tables):
+                            await session.execute(table.delete())
+
+                return
+
+            for level in _table_levels:
+                await asyncio.gather(*(self._purge_table(table) for table in level))
 
     async def dispose(self) -> None:
         """Dispose of the database engine and close all pooled connections."""
@@ -58,94 +416,99 @@ class Repository:
     # user management
     #################
 
-    async def find_user(self, username: str, *, eager: bool = False) -> User:
+    async def find_user(
+        self, username: str, *, session: AsyncSession | None = None,
+    ) -> User:
         """Find the user with the given user name."""
-        options = [selectinload(UserORM.blobs)] if eager else []
+        async with self._session(session) as db:
+            result = await db.execute(_select_user, dict(username=username))
 
-        whereclause = UserORM.username == username
-        stmt = select(UserORM).options(*options).where(whereclause)
-
-        async with self.session() as session:
-            result = await session.execute(stmt)
-
-            if not (user := result.scalar_one_or_none()):
+            if not (user := result.one_or_none()):
                 raise EntityNotFoundError(UserORM, username=username)
 
             return to_user(user)
 
-    async def register_user(self, username: str, password: str) -> User:
+    async def register_user(
+        self, username: str, password: str, *, session: AsyncSession | None = None,
+    ) -> User:
         """Register a user given a user name and a hashed password."""
         user = UserORM(username=username, password=password)
 
-        async with self.session() as session:
+        async with self._session(session) as db:
+            db.add(user)
+
             try:
-                async with session.begin():
-                    session.add(user)
+                await db.flush()
             except IntegrityError as e:
                 raise EntityConflictError(UserORM, username=username) from e
 
-            await session.refresh(user)
             return to_user(user)
 
-    async def update_password(self, username: str, password: str) -> None:
+    async def update_password(
+        self, username: str, password: str, *, session: AsyncSession | None = None,
+    ) -> None:
         """Update a user's password given the user name and the new hashed password."""
-        whereclause = UserORM.username == username
-        stmt = select(UserORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
+        params = dict(user_name=username, hashed_password=password)
 
-                if not (user := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(UserORM, username=username)
+        async with self._connection(session) as conn:
+            result = ty.cast(CursorResult, await conn.execute(_update_password, params))
 
-                user.password = password
+            if not result.rowcount:
+                raise EntityNotFoundError(UserORM, username=username)
 
-    async def delete_user(self, username: str) -> None:
-        """Delete a user by the given user name."""
-        whereclause = UserORM.username == username
-        stmt = select(UserORM).where(whereclause)
+    async def delete_user(
+        self, username: str, *, session: AsyncSession | None = None,
+    ) -> None:
+        """Delete a user by the given user name.
 
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
+        The rows owned by the user are deleted alongside in the same transaction.
+        """
+        params = dict(username=username)
+
+        async with self._session(session) as db:
+            for stmt in _delete_user_rows:
+                await db.execute(
+                    stmt,
+                    params,
+                    execution_options=dict(synchronize_session=False),
+                )
 
-                if not (user := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(UserORM, username=username)
+            result = ty.cast(CursorResult, await db.execute(_delete_user, params))
 
-                await session.delete(user)
+            if not result.rowcount:
+                raise EntityNotFoundError(UserORM, username=username)
 
     ###############
     # refresh token
     ###############
 
-    async def find_token(self, token_uid: str) -> JWTToken:
+    async def find_token(
+        self, token_uid: str, *, session: AsyncSession | None = None,
+    ) -> JWTToken:
         """Find the refresh token with the given token UID."""
-        option = selectinload(RefreshTokenORM.user)
-        whereclause = RefreshTokenORM.uid == token_uid
-        stmt = select(RefreshTokenORM).options(option).where(whereclause)
+        # A UID that is not canonical can never match a stored one.
+        if not BinaryUID.is_canonical(token_uid):
+            raise EntityNotFoundError(RefreshTokenORM, uid=token_uid)
 
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        async with self._session(session) as db:
+            result = await db.execute(_select_token, dict(token_uid=token_uid))
 
             if not (refresh_token := result.scalar_one_or_none()):
                 raise EntityNotFoundError(RefreshTokenORM, uid=token_uid)
 
             return to_token(refresh_token, user_uid=refresh_token.user.uid)
 
-    async def find_tokens(self, user_uid: str) -> list[JWTToken]:
+    async def find_tokens(
+        self, user_uid: str, *, session: AsyncSession | None = None,
+    ) -> list[JWTToken]:
         """Find all the refresh tokens for the given user UID."""
-        option = selectinload(UserORM.refresh_tokens)
-        whereclause = UserORM.uid == user_uid
-        stmt = select(UserORM).options(option).where(whereclause)
+        async with self._session(session) as db:
+            result = await db.execute(_select_tokens, dict(user_uid=user_uid))
 
-        async with self.session() as session:
-            result = await session.execute(stmt)
+            if not (refresh_tokens := result.all()):
+                await self._check_user(db, user_uid)
 
-            if not (user := result.scalar_one_or_none()):
-                raise EntityNotFoundError(UserORM, uid=user_uid)
-
-            return [to_token(token, user_uid=user_uid) for token in user.refresh_tokens]
+            return [to_token(token, user_uid=user_uid) for token in refresh_tokens]
 
     async def create_token(
         self,
@@ -153,115 +516,123 @@ class Repository:
         *,
         issued_at: datetime,
         expire_at: datetime,
+        session: AsyncSession | None = None,
         **metadata: ty.Any,
     ) -> JWTToken:
         """Create a refresh token for the given user UID."""
-        whereclause = UserORM.uid == user_uid
-        stmt = select(UserORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
+        _check_token_uids([metadata])
+
+        stmt = _insert_from(
+            RefreshTokenORM,
+            _select_user_id.params(user_uid=user_uid),
+            "user_id",
+            issued_at=issued_at,
+            expire_at=expire_at,
+            **metadata,
+        )
 
-                if not (user := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(UserORM, uid=user_uid)
+        async with self._session(session) as db:
+            result = await db.execute(stmt)
 
-                refresh_token = RefreshTokenORM(
-                    issued_at=issued_at,
-                    expire_at=expire_at,
-                    user_id=user.id,
-                    **metadata,
-                )
-                session.add(refresh_token)
+            if not (refresh_token := result.scalar_one_or_none()):
+                raise EntityNotFoundError(UserORM, uid=user_uid)
 
-            await session.refresh(refresh_token)
             return to_token(refresh_token, user_uid=user_uid)
 
-    async def revoke_token(self, token_uid: str) -> None:
-        """Revoke a refresh token given its UID."""
-        whereclause = RefreshTokenORM.uid == token_uid
-        stmt = select(RefreshTokenORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
+    async def create_tokens(
+        self,
+        user_uid: str,
+        items: abc.Sequence[dict[str, ty.Any]],
+        *,
+        session: AsyncSession | None = None,
+    ) -> list[JWTToken]:
+        """Create refresh tokens for the given user UID in a single statement.
 
-                if not (refresh_token := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(RefreshTokenORM, uid=token_uid)
+        Each item holds the keyword arguments taken by `create_token`, and the created
+        refresh tokens are returned in the order of `items`.
+        """
+        _check_token_uids(items)
 
-                refresh_token.revoked = True
+        async with self._session(session) as db:
+            user_id = await self._check_user(db, user_uid)
+            refresh_tokens = await _insert_many(db, RefreshTokenORM, user_id, items)
 
-    async def revoke_tokens(self, user_uid: str) -> int:
-        """Revoke all the refresh tokens for the given user UID."""
-        options = [
-            selectinload(UserORM.refresh_tokens),
-            with_loader_criteria(RefreshTokenORM, RefreshTokenORM.revoked.is_(False)),
-        ]
+            return [to_token(token, user_uid=user_uid) for token in refresh_tokens]
 
-        where_clause = UserORM.uid == user_uid
-        stmt = select(UserORM).options(*options).where(where_clause)
+    async def revoke_token(
+        self, token_uid: str, *, session: AsyncSession | None = None,
+    ) -> None:
+        """Revoke a refresh token given its UID."""
+        # A UID that is not canonical can never match a stored one.
+        if not BinaryUID.is_canonical(token_uid):
+            raise EntityNotFoundError(RefreshTokenORM, uid=token_uid)
 
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
+        async with self._connection(session) as conn:
+            result = ty.cast(
+                CursorResult,
+                await conn.execute(_revoke_token, dict(token_uid=token_uid)),
+            )
 
-                if not (user := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(UserORM, uid=user_uid)
+            if not result.rowcount:
+                raise EntityNotFoundError(RefreshTokenORM, uid=token_uid)
 
-                if not (refresh_tokens := user.refresh_tokens):
-                    return 0
+    async def revoke_tokens(
+        self, user_uid: str, *, session: AsyncSession | None = None,
+    ) -> int:
+        """Revoke all the refresh tokens for the given user UID."""
+        async with self._connection(session) as conn:
+            result = ty.cast(
+                CursorResult,
+                await conn.execute(_revoke_tokens, dict(user_uid=user_uid)),
+            )
 
-                for refresh_token in refresh_tokens:
-                    refresh_token.revoked = True
+            # Only tell a missing user apart from one with nothing to revoke.
+            if not (count := result.rowcount):
+                await self._check_user(conn, user_uid)
 
-                return len(refresh_tokens)
+            return count
 
     async def purge_tokens(
-        self, retention_days: int, now: datetime | None = None,
+        self,
+        retention_days: int,
+        now: datetime | None = None,
+        *,
+        batch_size: int | None = None,
     ) -> int:
         """Purge all the refresh tokens expired for longer than `retention_days`."""
-        cutoff = (now or datetime.now(UTC)) - timedelta(days=retention_days)
+        cutoff = _get_cutoff(retention_days, now)
         whereclause = RefreshTokenORM.expire_at < cutoff
-        stmt = delete(RefreshTokenORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
-                return result.rowcount
+        return await self._purge_in_batches(RefreshTokenORM, whereclause, batch_size)
 
     #############
     # blob files
     #############
 
-    async def find_blob(self, user_uid, *, blob_uid: str) -> tuple[Blob, str]:
+    async def find_blob(
+        self, user_uid, *, blob_uid: str, session: AsyncSession | None = None,
+    ) -> tuple[Blob, str]:
         """Find the specified blob and its blob key for the given user UID."""
-        whereclause = and_(
-            BlobORM.uid == blob_uid,
-            BlobORM.user.has(UserORM.uid == user_uid),
-        )
-        stmt = select(BlobORM).where(whereclause)
+        params = dict(blob_uid=blob_uid, user_uid=user_uid)
 
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        async with self._session(session) as db:
+            result = await db.execute(_select_blob, params)
 
-            if not (blob := result.scalar_one_or_none()):
+            if not (blob := result.one_or_none()):
                 raise EntityNotFoundError(BlobORM, uid=blob_uid)
 
             return to_blob(blob), blob.blob_key
 
-    async def find_blobs(self, user_uid: str) -> list[Blob]:
+    async def find_blobs(
+        self, user_uid: str, *, session: AsyncSession | None = None,
+    ) -> list[Blob]:
         """Find all the blob for the given user UID."""
-        option = selectinload(UserORM.blobs)
-        whereclause = UserORM.uid == user_uid
-        stmt = select(UserORM).options(option).where(whereclause)
-
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        async with self._session(session) as db:
+            result = await db.execute(_select_blobs, dict(user_uid=user_uid))
 
-            if not (user := result.scalar_one_or_none()):
-                raise EntityNotFoundError(UserORM, uid=user_uid)
+            if not (blobs := result.all()):
+                await self._check_user(db, user_uid)
 
-            return [to_blob(blob) for blob in user.blobs]
+            return [to_blob(blob) for blob in blobs]
 
     async def create_blob(
         self,
@@ -271,104 +642,109 @@ class Repository:
         file_name: str,
         created_at: datetime,
         valid_thru: datetime,
+        session: AsyncSession | None = None,
     ) -> Blob:
         """Create a blob for the given user UID."""
-        whereclause = UserORM.uid == user_uid
-        stmt = select(UserORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
-
-                if not (user := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(UserORM, uid=user_uid)
-
-                blob = BlobORM(
-                    blob_key=blob_key,
-                    file_name=file_name,
-                    created_at=created_at,
-                    valid_thru=valid_thru,
-                    user_id=user.id,
-                )
+        stmt = _insert_from(
+            BlobORM,
+            _select_user_id.params(user_uid=user_uid),
+            "user_id",
+            blob_key=blob_key,
+            file_name=file_name,
+            created_at=created_at,
+            valid_thru=valid_thru,
+        )
 
-                session.add(blob)
+        async with self._session(session) as db:
+            result = await db.execute(stmt)
+
+            if not (blob := result.scalar_one_or_none()):
+                raise EntityNotFoundError(UserORM, uid=user_uid)
 
-            await session.refresh(blob)
             return to_blob(blob)
 
-    async def delete_blob(self, blob_uid: str) -> None:
-        """Delete a blob given the blob UID."""
-        whereclause = BlobORM.uid == blob_uid
-        stmt = delete(BlobORM).where(whereclause)
+    async def create_blobs(
+        self,
+        user_uid: str,
+        items: abc.Sequence[dict[str, ty.Any]],
+        *,
+        session: AsyncSession | None = None,
+    ) -> list[Blob]:
+        """Create blobs for the given user UID in a single statement.
 
-        async with self.session() as session:
-            async with session.begin():
-                await session.execute(stmt)
+        Each item holds the keyword arguments taken by `create_blob`, and the created
+        blobs are returned in the order of `items`.
+        """
+        async with self._session(session) as db:
+            user_id = await self._check_user(db, user_uid)
+            blobs = await _insert_many(db, BlobORM, user_id, items)
 
-    async def delete_blobs(self, user_uid: str) -> int:
-        """Delete all the blobs for the given user UID."""
-        whereclause = UserORM.uid == user_uid
-        select_stmt = select(UserORM).where(whereclause)
+            return [to_blob(blob) for blob in blobs]
 
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(select_stmt)
+    async def delete_blob(
+        self, blob_uid: str, *, session: AsyncSession | None = None,
+    ) -> None:
+        """Delete a blob given the blob UID."""
+        async with self._connection(session) as conn:
+            await conn.execute(_delete_blob, dict(blob_uid=blob_uid))
 
-                if not (user := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(UserORM, uid=user_uid)
+    async def delete_blobs(
+        self, user_uid: str, *, session: AsyncSession | None = None,
+    ) -> int:
+        """Delete all the blobs for the given user UID."""
+        async with self._connection(session) as conn:
+            result = ty.cast(
+                CursorResult,
+                await conn.execute(_delete_blobs, dict(user_uid=user_uid)),
+            )
 
-                whereclause = BlobORM.user_id == user.id
-                delete_stmt = delete(BlobORM).where(whereclause)
+            # Only tell a missing user apart from one with nothing to delete.
+            if not (count := result.rowcount):
+                await self._check_user(conn, user_uid)
 
-                result = await session.execute(delete_stmt)
-                return result.rowcount
+            return count
 
     async def purge_blobs(
-        self, retention_days: int, now: datetime | None = None,
+        self,
+        retention_days: int,
+        now: datetime | None = None,
+        *,
+        batch_size: int | None = None,
     ) -> int:
         """Purge all the blobs expired for longer than `retention_days`."""
-        cutoff = (now or datetime.now(UTC)) - timedelta(days=retention_days)
+        cutoff = _get_cutoff(retention_days, now)
         whereclause = BlobORM.valid_thru < cutoff
-        stmt = delete(BlobORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
-                return result.rowcount
+        return await self._purge_in_batches(BlobORM, whereclause, batch_size)
 
     ##############
     # blob uploads
     ##############
 
-    async def find_upload(self, user_uid: str, *, upload_id: str) -> Upload:
+    async def find_upload(
+        self, user_uid: str, *, upload_id: str, session: AsyncSession | None = None,
+    ) -> Upload:
         """Find the specified blob upload for the given user UID."""
-        whereclause = and_(
-            UploadORM.uid == upload_id,
-            UploadORM.user.has(UserORM.uid == user_uid),
-        )
-        stmt = select(UploadORM).where(whereclause)
+        params = dict(upload_id=upload_id, user_uid=user_uid)
 
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        async with self._session(session) as db:
+            result = await db.execute(_select_upload, params)
 
-            if not (upload := result.scalar_one_or_none()):
+            if not (upload := result.one_or_none()):
                 raise EntityNotFoundError(UploadORM, uid=upload_id)
 
             return to_upload(upload)
 
-    async def find_uploads(self, user_uid: str) -> list[Upload]:
+    async def find_uploads(
+        self, user_uid: str, *, session: AsyncSession | None = None,
+    ) -> list[Upload]:
         """Find all the uploads for the given user UID."""
-        option = selectinload(UserORM.uploads)
-        whereclause = UserORM.uid == user_uid
-        stmt = select(UserORM).options(option).where(whereclause)
-
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        async with self._session(session) as db:
+            result = await db.execute(_select_uploads, dict(user_uid=user_uid))
 
-            if not (user := result.scalar_one_or_none()):
-                raise EntityNotFoundError(UserORM, uid=user_uid)
+            if not (uploads := result.all()):
+                await self._check_user(db, user_uid)
 
-            return [to_upload(upload) for upload in user.uploads]
+            return [to_upload(upload) for upload in uploads]
 
     async def start_upload(
         self,
@@ -378,113 +754,180 @@ class Repository:
         blob_key: str,
         created_at: datetime,
         valid_thru: datetime,
+        session: AsyncSession | None = None,
     ) -> Upload:
         """Start an upload of a blob for the given user UID."""
-        whereclause = UserORM.uid == user_uid
-        stmt = select(UserORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
-
-                if not (user := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(UserORM, uid=user_uid)
-
-                upload = UploadORM(
-                    uid=uid,
-                    blob_key=blob_key,
-                    created_at=created_at,
-                    valid_thru=valid_thru,
-                    user_id=user.id,
-                )
-                session.add(upload)
+        stmt = _insert_from(
+            UploadORM,
+            _select_user_id.params(user_uid=user_uid),
+            "user_id",
+            uid=uid,
+            blob_key=blob_key,
+            created_at=created_at,
+            valid_thru=valid_thru,
+        )
+
+        async with self._session(session) as db:
+            result = await db.execute(stmt)
+
+            if not (upload := result.scalar_one_or_none()):
+                raise EntityNotFoundError(UserORM, uid=user_uid)
 
-            await session.refresh(upload)
             return to_upload(upload)
 
-    async def remove_upload(self, uid: str) -> None:
+    async def start_uploads(
+        self,
+        user_uid: str,
+        items: abc.Sequence[dict[str, ty.Any]],
+        *,
+        session: AsyncSession | None = None,
+    ) -> list[Upload]:
+        """Start uploads of blobs for the given user UID in a single statement.
+
+        Each item holds the keyword arguments taken by `start_upload`, and the started
+        uploads are returned in the order of `items`.
+        """
+        async with self._session(session) as db:
+            user_id = await self._check_user(db, user_uid)
+            uploads = await _insert_many(db, UploadORM, user_id, items)
+
+            return [to_upload(upload) for upload in uploads]
+
+    async def remove_upload(
+        self, uid: str, *, session: AsyncSession | None = None,
+    ) -> None:
         """Remove an upload with the given upload ID.
 
         An upload is removable when it's either finished or canceled.
         """
-        whereclause = UploadORM.uid == uid
-        stmt = delete(UploadORM).where(whereclause)
+        async with self._connection(session) as conn:
+            await conn.execute(_delete_upload, dict(upload_id=uid))
+
+    async def finish_upload(
+        self,
+        user_uid: str,
+        upload_id: str,
+        *,
+        file_name: str,
+        created_at: datetime,
+        valid_thru: datetime,
+        session: AsyncSession | None = None,
+    ) -> Blob:
+        """Finish an upload for the given user UID by turning it into a blob.
+
+        The upload is removed and the blob created in the same transaction.
+        """
+        params = dict(upload_id=upload_id, user_uid=user_uid)
+
+        async with self._session(session) as db:
+            result = await db.execute(_finish_upload, params)
+
+            if (blob_key := result.scalars().first()) is None:
+                raise EntityNotFoundError(UploadORM, uid=upload_id)
 
-        async with self.session() as session:
-            async with session.begin():
-                await session.execute(stmt)
+            return await self.create_blob(
+                user_uid,
+                blob_key=blob_key,
+                file_name=file_name,
+                created_at=created_at,
+                valid_thru=valid_thru,
+                session=db,
+            )
 
     async def purge_uploads(
-        self, retention_days: int, now: datetime | None = None,
-    ) -> list[Upload]:
-        """Purge all the uploads expired for longer than `retention_days`."""
-        cutoff = (now or datetime.now(UTC)) - timedelta(days=retention_days)
-        whereclause = UploadORM.valid_thru < cutoff
-        select_stmt = select(UploadORM).where(whereclause)
-        delete_stmt = delete(UploadORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(select_stmt)
-                uploads = result.scalars().all()
-                await session.execute(delete_stmt)
-                return [to_upload(upload) for upload in uploads]
+        self,
+        retention_days: int,
+        now: datetime | None = None,
+        *,
+        batch_size: int | None = None,
+    ) -> abc.AsyncGenerator[Upload, None]:
+        """Purge all the uploads expired for longer than `retention_days`.
+
+        The uploads are deleted in batches of `batch_size`, each committed in its own
+        transaction before its purged uploads are yielded. No connection is held while
+        the caller handles them, and a caller that stops early only leaves the batches
+        it has not read in place.
+        """
+        batch_size = _check_batch_size(
+            self._purge_batch_size if batch_size is None else batch_size,
+        )
+        cutoff = _get_cutoff(retention_days, now)
+        stmt = (
+            delete(UploadORM)
+            .where(
+                UploadORM.id.in_(
+                    select(UploadORM.id)
+                    .where(UploadORM.valid_thru < cutoff)
+                    .limit(batch_size),
+                ),
+            )
+            .returning(*_upload_columns)
+        )
+
+        while True:
+            async with self._purge_lock, self._engine.begin() as conn:
+                uploads = (await conn.execute(stmt)).all()
+
+            for upload in uploads:
+                yield to_upload(upload)
+
+            if len(uploads) < batch_size:
+                return
 
     ##############
     # compute jobs
     ##############
 
-    async def find_jobs(self, blob_uid: str) -> list[ComputeJob]:
+    async def find_jobs(
+        self, blob_uid: str, *, session: AsyncSession | None = None,
+    ) -> list[ComputeJob]:
         """Find all the compute jobs for the given blob UID."""
-        option = selectinload(BlobORM.jobs)
-        whereclause = BlobORM.uid == blob_uid
-        stmt = select(BlobORM).options(option).where(whereclause)
-
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        params = dict(blob_uid=blob_uid)
 
-            if not (blob := result.scalar_one_or_none()):
-                raise EntityNotFoundError(BlobORM, uid=blob_uid)
-
-            return [to_job(job) for job in blob.jobs]
+        async with self._session(session) as db:
+            result = await db.execute(_select_jobs, params)
 
-    async def find_latest_job(self, blob_uid: str) -> ComputeJob:
-        """Find the latest compute job for a blob with the given UID."""
-        whereclause = ComputeJobORM.blob.has(BlobORM.uid == blob_uid)
+            if not (jobs := result.all()):
+                result = await db.execute(_select_blob_id, params)
 
-        latest = (
-            select(func.max(ComputeJobORM.requested_at))
-            .where(whereclause)
-            .scalar_subquery()
-        )
+                if result.scalar_one_or_none() is None:
+                    raise EntityNotFoundError(BlobORM, uid=blob_uid)
 
-        whereclause = and_(whereclause, ComputeJobORM.requested_at == latest)
-        stmt = select(ComputeJobORM).where(whereclause)
+            return [to_job(job) for job in jobs]
 
-        async with self.session() as session:
-            result = await session.execute(stmt)
+    async def find_latest_job(
+        self, blob_uid: str, *, session: AsyncSession | None = None,
+    ) -> ComputeJob:
+        """Find the latest compute job for a blob with the given UID."""
+        async with self._session(session) as db:
+            result = await db.execute(_select_latest_job, dict(blob_uid=blob_uid))
 
-            if (job := result.scalar_one_or_none()) is None:
+            if (job := result.one_or_none()) is None:
                 raise EntityNotFoundError(ComputeJobORM, blob_uid=blob_uid)
 
             return to_job(job)
 
-    async def submit_job(self, blob_uid: str, *, requested_at: datetime) -> ComputeJob:
+    async def submit_job(
+        self,
+        blob_uid: str,
+        *,
+        requested_at: datetime,
+        session: AsyncSession | None = None,
+    ) -> ComputeJob:
         """Submit a compute job for the given blob UID."""
-        whereclause = BlobORM.uid == blob_uid
-        stmt = select(BlobORM).where(whereclause)
-
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
+        stmt = _insert_from(
+            ComputeJobORM,
+            _select_blob_id.params(blob_uid=blob_uid),
+            "blob_id",
+            requested_at=requested_at,
+        )
 
-                if not (blob := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(BlobORM, uid=blob_uid)
+        async with self._session(session) as db:
+            result = await db.execute(stmt)
 
-                job = ComputeJobORM(requested_at=requested_at, blob_id=blob.id)
-                session.add(job)
+            if not (job := result.scalar_one_or_none()):
+                raise EntityNotFoundError(BlobORM, uid=blob_uid)
 
-            await session.refresh(job)
             return to_job(job)
 
     async def update_job(
@@ -493,6 +936,7 @@ class Repository:
         *,
         status: JobStatus = "finished",
         blob_key: str | None = None,
+        session: AsyncSession | None = None,
     ) -> None:
         """Update the specified compute job with the given metadata."""
         if (status == "finished" and not blob_key) or (
@@ -500,42 +944,103 @@ class Repository:
         ):
             raise ValueError(f"{blob_key=} is disallowed when {status=}.")
 
-        whereclause = ComputeJobORM.uid == job_id
-        stmt = select(ComputeJobORM).where(whereclause)
+        params = dict(job_id=job_id, job_status=status, result_key=blob_key)
 
-        async with self.session() as session:
-            async with session.begin():
-                result = await session.execute(stmt)
+        async with self._connection(session) as conn:
+            result = ty.cast(CursorResult, await conn.execute(_update_job, params))
 
-                if not (job := result.scalar_one_or_none()):
-                    raise EntityNotFoundError(ComputeJobORM, uid=job_id)
-
-                job.status = status
-                job.blob_key = blob_key
+            if not result.rowcount:
+                raise EntityNotFoundError(ComputeJobORM, uid=job_id)
 
-    async def load_blob_key(self, job_id: str) -> str:
+    async def load_blob_key(
+        self, job_id: str, *, session: AsyncSession | None = None,
+    ) -> str:
         """Get the blob key for the given job ID."""
-        option = selectinload(ComputeJobORM.blob)
-        whereclause = ComputeJobORM.uid == job_id
-        stmt = select(ComputeJobORM).options(option).where(whereclause)
-
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        async with self._session(session) as db:
+            result = await db.execute(_select_blob_key, dict(job_id=job_id))
 
-            if not (job := result.scalar_one_or_none()):
+            if (blob_key := result.scalar_one_or_none()) is None:
                 raise EntityNotFoundError(ComputeJobORM, uid=job_id)
 
-            return job.blob.blob_key
+            return blob_key
 
-    async def load_result_blob_key(self, job_id: str) -> str | None:
+    async def load_result_blob_key(
+        self, job_id: str, *, session: AsyncSession | None = None,
+    ) -> str | None:
         """Get the result blob key for the given job ID."""
-        whereclause = ComputeJobORM.uid == job_id
-        stmt = select(ComputeJobORM).where(whereclause)
-
-        async with self.session() as session:
-            result = await session.execute(stmt)
+        async with self._session(session) as db:
+            result = await db.execute(_select_result_key, dict(job_id=job_id))
 
-            if not (job := result.scalar_one_or_none()):
+            if not (job := result.one_or_none()):
                 raise EntityNotFoundError(ComputeJobORM, uid=job_id)
 
             return job.blob_key
+
+    # -- helper functions
+
+    @asynccontextmanager
+    async def _session(
+        self, session: AsyncSession | None,
+    ) -> abc.AsyncIterator[AsyncSession]:
+        """Yield the given session or a new one committed on exit."""
+        if session is not None:
+            yield session
+            return
+
+        async with self.session() as new_session, new_session.begin():
+            yield new_session
+
+    @asynccontextmanager
+    async def _connection(
+        self, session: AsyncSession | None,
+    ) -> abc.AsyncIterator[AsyncConnection | AsyncSession]:
+        """Yield the given session or a new connection committed on exit."""
+        if session is not None:
+            yield session
+            return
+
+        async with self._engine.begin() as conn:
+            yield conn
+
+    async def _purge_table(self, table: Table) -> None:
+        """Purge the given table in its own transaction."""
+        async with self._engine.begin() as conn:
+            await conn.execute(table.delete())
+
+    async def _check_user(
+        self, session: AsyncConnection | AsyncSession, user_uid: str,
+    ) -> int:
+        """Check if a user with the given user UID exists and get its ID."""
+        result = await session.execute(_select_user_id, dict(user_uid=user_uid))
+
+        if (user_id := result.scalar_one_or_none()) is None:
+            raise EntityNotFoundError(UserORM, uid=user_uid)
+
+        return user_id
+
+    async def _purge_in_batches(
+        self, klass: type[Base], whereclause: ty.Any, batch_size: int | None,
+    ) -> int:
+        """Delete the rows matching `whereclause` in batches of `batch_size`.
+
+        Each batch is committed in its own transaction to keep locks and WAL short.
+        """
+        batch_size = _check_batch_size(
+            self._purge_batch_size if batch_size is None else batch_size,
+        )
+        pk = klass.id  # type: ignore[attr-defined]
+        stmt = delete(klass).where(
+            pk.in_(select(pk).where(whereclause).limit(batch_size)),
+        )
+
+        total = 0
+
+        async with self._purge_lock, self._engine.connect() as conn:
+            while True:
+                async with conn.begin():
+                    result = await conn.execute(stmt)
+
+                total += (count := result.rowcount)
+
+                if count < batch_size:
+                    return total
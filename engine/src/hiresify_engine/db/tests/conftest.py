@@ -7,6 +7,7 @@ import typing as ty
 
 import pytest
 
+from hiresify_engine.model import User
 from hiresify_engine.testing import test_repository
 
 from ..repository import Repository
@@ -14,7 +15,7 @@ from ..repository import Repository
 
 @pytest.fixture(scope="session")
 async def repository() -> ty.AsyncGenerator[Repository, None]:
-    """Create a temporary file-based repository for testing."""
+    """Create an in-memory repository for testing."""
     async with test_repository() as repository:
         yield repository
 
@@ -23,3 +24,9 @@ async def repository() -> ty.AsyncGenerator[Repository, None]:
 async def purge_tables(repository: Repository) -> None:
     """Purge all the tables in-between tests."""
     await repository.purge_tables()
+
+
+@pytest.fixture(scope="function")
+async def user(repository: Repository) -> User:
+    """Register a user for the tests that need one."""
+    return await repository.register_user("ywu", "123")
@@ -3,13 +3,30 @@
 # This file is not licensed for use, modification, or distribution without
 # explicit written permission from the copyright holder.
 
+import asyncio
+import typing as ty
 from datetime import UTC, datetime, timedelta
-from uuid import uuid4
+from itertools import count
+from uuid import UUID
 
 import pytest
+from sqlalchemy import event, func, inspect, select
+
+from hiresify_engine.model import Blob, Upload, User
 
 from ..exception import EntityConflictError, EntityNotFoundError
-from ..repository import Repository
+from ..model import Base
+from ..repository import Repository, _table_levels
+
+# The fixed reference time that the test timestamps are derived from.
+_now = datetime(2025, 1, 1, tzinfo=UTC)
+
+# The time steps between test timestamps and past a 1-day retention period.
+_second = timedelta(seconds=1)
+_two_days = timedelta(days=2)
+
+# The deterministic hex UIDs that the test blob keys and unknown UIDs draw from.
+_uids = (UUID(int=i).hex for i in count(1))
 
 #################
 # user management
@@ -69,7 +86,26 @@ async def test_delete_user(repository: Repository) -> None:
         await repository.delete_user(username)
 
     # Given
-    await repository.register_user(username, "123")
+    user = await repository.register_user(username, "123")
+
+    refresh_token = await repository.create_token(
+        user.uid, issued_at=_now, expire_at=_now + _second,
+    )
+    blob = await repository.create_blob(
+        user.uid,
+        blob_key=f"{user.uid}/image/{next(_uids)}.png",
+        file_name="blob.png",
+        created_at=_now,
+        valid_thru=_now + _second,
+    )
+    await repository.submit_job(blob.uid, requested_at=_now)
+    upload = await repository.start_upload(
+        user.uid,
+        uid="upload-id",
+        blob_key=f"{user.uid}/image/{next(_uids)}.png",
+        created_at=_now,
+        valid_thru=_now + _second,
+    )
 
     # When
     await repository.delete_user(username)
@@ -78,16 +114,42 @@ async def test_delete_user(repository: Repository) -> None:
     with pytest.raises(EntityNotFoundError):
         await repository.find_user(username)
 
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_token(refresh_token.uid)
+
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_blob(user.uid, blob_uid=blob.uid)
+
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_jobs(blob.uid)
+
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_upload(user.uid, upload_id=upload.uid)
+
+    # The lookups join through the parents, so the orphans are counted directly.
+    async with repository.engine.connect() as conn:
+        for table in Base.metadata.sorted_tables:
+            count_stmt = select(func.count()).select_from(table)
+            assert not (await conn.execute(count_stmt)).scalar_one(), table.name
+
+
 ###############
 # refresh token
 ###############
 
 async def test_create_token(repository: Repository) -> None:
+    # When/Then
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_tokens(next(_uids))
+
     # Given
     user = await repository.register_user("ywu", "123")
 
-    issued_at = datetime.now(UTC)
-    expire_at = issued_at + timedelta(seconds=1)
+    # When/Then
+    assert not await repository.find_tokens(user.uid)
+
+    issued_at = _now
+    expire_at = issued_at + _second
 
     # When
     refresh_token = await repository.create_token(
@@ -100,12 +162,10 @@ async def test_create_token(repository: Repository) -> None:
     assert refresh_token.expire_at > refresh_token.issued_at
 
 
-async def test_revoke_token(repository: Repository) -> None:
+async def test_revoke_token(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
-    issued_at = datetime.now(UTC)
-    expire_at = issued_at + timedelta(seconds=1)
+    issued_at = _now
+    expire_at = issued_at + _second
 
     refresh_token = await repository.create_token(
         user.uid,
@@ -127,50 +187,98 @@ async def test_revoke_token(repository: Repository) -> None:
     assert refresh_token.revoked
 
 
-async def test_revoke_tokens(repository: Repository) -> None:
+async def test_token_uid(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
+    uid = "0123456789abcdef" * 2
+    issued_at = _now
+    expire_at = issued_at + _second
 
-    issued_at = datetime.now(UTC)
-    for _ in range(3):
-        expire_at = issued_at + timedelta(seconds=1)
-        await repository.create_token(
-            user.uid,
-            issued_at=issued_at,
-            expire_at=expire_at,
-        )
-        issued_at = expire_at
+    # When
+    refresh_token = await repository.create_token(
+        user.uid,
+        issued_at=issued_at,
+        expire_at=expire_at,
+        uid=uid,
+    )
+
+    # Then
+    assert refresh_token.uid == uid
+    assert (await repository.find_token(uid)).uid == uid
+
+    # When/Then
+    for invalid_uid in ("tok-1", uid.upper()):
+        with pytest.raises(ValueError):
+            await repository.create_token(
+                user.uid,
+                issued_at=issued_at,
+                expire_at=expire_at,
+                uid=invalid_uid,
+            )
+
+        with pytest.raises(ValueError):
+            await repository.create_tokens(
+                user.uid,
+                [dict(issued_at=issued_at, expire_at=expire_at, uid=invalid_uid)],
+            )
+
+    # When/Then
+    for noncanonical_uid in (uid.upper(), bytes.fromhex(uid).hex(" ")):
+        with pytest.raises(EntityNotFoundError):
+            await repository.find_token(noncanonical_uid)
+
+        with pytest.raises(EntityNotFoundError):
+            await repository.revoke_token(noncanonical_uid)
+
+
+async def test_revoke_tokens(repository: Repository, user: User) -> None:
+    # Given
+    issued_at = _now
+    await repository.create_tokens(
+        user.uid,
+        [
+            dict(
+                issued_at=issued_at + i * _second,
+                expire_at=issued_at + (i + 1) * _second,
+            )
+            for i in range(3)
+        ],
+    )
 
     # When
     refresh_tokens = await repository.find_tokens(user.uid)
 
     # Then
-    for refresh_token in refresh_tokens:
-        assert not refresh_token.revoked
+    assert not any(refresh_token.revoked for refresh_token in refresh_tokens)
 
     # When
-    await repository.revoke_tokens(user.uid)
+    count = await repository.revoke_tokens(user.uid)
     refresh_tokens = await repository.find_tokens(user.uid)
 
     # Then
-    for refresh_token in refresh_tokens:
-        assert refresh_token.revoked
+    assert count == 3
+    assert all(refresh_token.revoked for refresh_token in refresh_tokens)
 
+    # When/Then
+    assert await repository.revoke_tokens(user.uid) == 0
 
-async def test_purge_tokens(repository: Repository) -> None:
-    # Given
-    user = await repository.register_user("ywu", "123")
-    
-    issued_at = datetime.now(UTC)
+    # When/Then
+    with pytest.raises(EntityNotFoundError):
+        await repository.revoke_tokens(next(_uids))
 
-    for _ in range(3):
-        expire_at = issued_at + timedelta(seconds=1)
-        refresh_token = await repository.create_token(
-            user.uid,
-            issued_at=issued_at,
-            expire_at=expire_at,
-        )
-        issued_at = expire_at
+
+async def test_purge_tokens(repository: Repository, user: User) -> None:
+    # Given
+    issued_at = _now
+    *_, refresh_token = await repository.create_tokens(
+        user.uid,
+        [
+            dict(
+                issued_at=issued_at + i * _second,
+                expire_at=issued_at + (i + 1) * _second,
+            )
+            for i in range(3)
+        ],
+    )
 
     # When
     refresh_tokens = await repository.find_tokens(user.uid)
@@ -179,27 +287,39 @@ async def test_purge_tokens(repository: Repository) -> None:
     assert len(refresh_tokens) == 3
 
     # When
-    await repository.purge_tokens(1, refresh_token.expire_at + timedelta(days=2))
+    count = await repository.purge_tokens(
+        1, refresh_token.expire_at + _two_days, batch_size=2,
+    )
     refresh_tokens = await repository.find_tokens(user.uid)
 
     # Then
+    assert count == 3
     assert not refresh_tokens
 
+    # When/Then
+    for batch_size in (0, -1):
+        with pytest.raises(ValueError):
+            await repository.purge_tokens(1, batch_size=batch_size)
+
+        with pytest.raises(ValueError):
+            await anext(repository.purge_uploads(1, batch_size=batch_size))
+
+        with pytest.raises(ValueError):
+            Repository("sqlite+aiosqlite://", purge_batch_size=batch_size)
+
 ############
 # blob files
 ############
 
-async def test_create_blob(repository: Repository) -> None:
+async def test_create_blob(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
-    created_at = datetime.now(UTC)
-    valid_thru = created_at + timedelta(seconds=1)
+    created_at = _now
+    valid_thru = created_at + _second
 
     # When
     blob = await repository.create_blob(
         user.uid,
-        blob_key=f"{user.uid}/image/{uuid4().hex}.png",
+        blob_key=f"{user.uid}/image/{next(_uids)}.png",
         file_name="blob.png",
         created_at=created_at,
         valid_thru=valid_thru,
@@ -209,15 +329,13 @@ async def test_create_blob(repository: Repository) -> None:
     assert blob.valid_thru > blob.created_at
 
 
-async def test_delete_blob(repository: Repository) -> None:
+async def test_delete_blob(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
-    blob_key = f"{user.uid}/image/{uuid4().hex}.png"
+    blob_key = f"{user.uid}/image/{next(_uids)}.png"
     file_name = "blob.png"
 
-    created_at = datetime.now(UTC)
-    valid_thru = created_at + timedelta(seconds=1)
+    created_at = _now
+    valid_thru = created_at + _second
 
     blob = await repository.create_blob(
         user.uid,
@@ -228,16 +346,19 @@ async def test_delete_blob(repository: Repository) -> None:
     )
 
     # When
-    blob, key = await repository.find_blob(user.uid, blob_uid=blob.uid)
+    found = await repository.find_blob(user.uid, blob_uid=blob.uid)
 
     # Then
-    assert blob.file_name == file_name
-    assert blob.mime_type == "image/png"
-
-    assert blob.created_at == created_at
-    assert blob.valid_thru == valid_thru
-
-    assert key == blob_key
+    assert found == (
+        Blob(
+            uid=blob.uid,
+            file_name=file_name,
+            mime_type="image/png",
+            created_at=created_at,
+            valid_thru=valid_thru,
+        ),
+        blob_key,
+    )
 
     # When
     await repository.delete_blob(blob.uid)
@@ -247,23 +368,23 @@ async def test_delete_blob(repository: Repository) -> None:
         await repository.find_blob(user.uid, blob_uid=blob.uid)
 
 
-async def test_delete_blobs(repository: Repository) -> None:
+async def test_delete_blobs(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
-    created_at = datetime.now(UTC)
+    created_at = _now
     file_names = [f"blob{i}.png" for i in range(1, 4)]
 
-    for file_name in file_names:
-        valid_thru = created_at + timedelta(seconds=1)
-        await repository.create_blob(
-            user.uid,
-            blob_key=f"{user.uid}/image/{uuid4().hex}.png",
-            file_name=file_name,
-            created_at=created_at,
-            valid_thru=valid_thru,
-        )
-        created_at = valid_thru
+    await repository.create_blobs(
+        user.uid,
+        [
+            dict(
+                blob_key=f"{user.uid}/image/{next(_uids)}.png",
+                file_name=file_name,
+                created_at=created_at + i * _second,
+                valid_thru=created_at + (i + 1) * _second,
+            )
+            for i, file_name in enumerate(file_names)
+        ],
+    )
 
     # When
     blobs = await repository.find_blobs(user.uid)
@@ -279,23 +400,23 @@ async def test_delete_blobs(repository: Repository) -> None:
     assert not blobs
 
 
-async def test_purge_blobs(repository: Repository) -> None:
+async def test_purge_blobs(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-    
-    created_at = datetime.now(UTC)
+    created_at = _now
     file_names = [f"blob{i}.png" for i in range(1, 4)]
 
-    for file_name in file_names:
-        valid_thru = created_at + timedelta(seconds=1)
-        blob = await repository.create_blob(
-            user.uid,
-            blob_key=f"{user.uid}/image/{uuid4().hex}.png",
-            file_name=file_name,
-            created_at=created_at,
-            valid_thru=valid_thru,
-        )
-        created_at = valid_thru
+    *_, blob = await repository.create_blobs(
+        user.uid,
+        [
+            dict(
+                blob_key=f"{user.uid}/image/{next(_uids)}.png",
+                file_name=file_name,
+                created_at=created_at + i * _second,
+                valid_thru=created_at + (i + 1) * _second,
+            )
+            for i, file_name in enumerate(file_names)
+        ],
+    )
 
     # When
     blobs = await repository.find_blobs(user.uid)
@@ -304,25 +425,118 @@ async def test_purge_blobs(repository: Repository) -> None:
     assert len(blobs) == len(file_names)
 
     # When
-    await repository.purge_blobs(1, blob.valid_thru + timedelta(days=2))
+    await repository.purge_blobs(1, blob.valid_thru + _two_days)
     blobs = await repository.find_blobs(user.uid)
 
     # Then
     assert not blobs
 
+
+###########################
+# repository infrastructure
+###########################
+
+async def test_shared_session(repository: Repository) -> None:
+    # Given
+    issued_at = _now
+    expire_at = issued_at + _second
+
+    # When
+    async with repository.session() as session:
+        async with session.begin():
+            user = await repository.register_user("ywu", "123", session=session)
+            await repository.create_token(
+                user.uid,
+                issued_at=issued_at,
+                expire_at=expire_at,
+                session=session,
+            )
+
+    # Then
+    assert len(await repository.find_tokens(user.uid)) == 1
+
+    # When
+    async with repository.session() as session:
+        await repository.register_user("wyf", "123", session=session)
+        await session.rollback()
+
+    # Then
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_user("wyf")
+
+
+def test_table_levels() -> None:
+    # When
+    levels = [{table.name for table in level} for level in _table_levels]
+
+    # Then
+    assert levels == [{"compute_job"}, {"refresh_token", "blob", "upload"}, {"user"}]
+
+
+async def test_init_schema(repository: Repository) -> None:
+    # Given
+    async with repository.engine.begin() as conn:
+        await conn.exec_driver_sql("DROP INDEX ix_blob_valid_thru")
+
+    # When
+    await repository.init_schema()
+
+    # Then
+    async with repository.engine.connect() as conn:
+        indexes = await conn.run_sync(lambda sync: inspect(sync).get_indexes("blob"))
+
+    assert "ix_blob_valid_thru" in {index["name"] for index in indexes}
+
+
+async def test_invalidated_connection(repository: Repository) -> None:
+    # Given
+    async with repository.engine.connect() as conn:
+        await conn.invalidate()
+
+    # When/Then
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_user("ywu")
+
+
+async def test_purge_plans(repository: Repository) -> None:
+    # Given
+    statements: list[tuple[str, ty.Any]] = []
+
+    def capture(_conn, _cursor, statement, parameters, *_: ty.Any) -> None:
+        if statement.startswith("DELETE"):
+            statements.append((statement, parameters))
+
+    engine = repository.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", capture)
+
+    # When
+    try:
+        await repository.purge_tokens(1)
+        await repository.purge_blobs(1)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    # Then
+    async with repository.engine.connect() as conn:
+        plans = [
+            str((await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params)).all())
+            for sql, params in statements
+        ]
+
+    assert "INDEX ix_refresh_token_expire_at (expire_at<?)" in plans[0]
+    assert "INDEX ix_blob_valid_thru (valid_thru<?)" in plans[1]
+
 ##############
 # upload blobs
 ##############
 
-async def test_start_upload(repository: Repository) -> None:
+async def test_start_upload(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
     upload_id = "upload-id"
-    blob_key = f"{user.uid}/blob/{uuid4().hex}.png"
+    blob_key = f"{user.uid}/blob/{next(_uids)}.png"
 
-    created_at = datetime.now(UTC)
-    valid_thru = created_at + timedelta(seconds=1)
+    created_at = _now
+    valid_thru = created_at + _second
 
     # When
     upload = await repository.start_upload(
@@ -337,15 +551,13 @@ async def test_start_upload(repository: Repository) -> None:
     assert upload.valid_thru > upload.created_at
 
 
-async def test_remove_upload(repository: Repository) -> None:
+async def test_remove_upload(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
     upload_id = "upload-id"
-    blob_key = f"{user.uid}/blob/{uuid4().hex}.png"
+    blob_key = f"{user.uid}/blob/{next(_uids)}.png"
 
-    created_at = datetime.now(UTC)
-    valid_thru = created_at + timedelta(seconds=1)
+    created_at = _now
+    valid_thru = created_at + _second
 
     await repository.start_upload(
         user.uid,
@@ -359,10 +571,12 @@ async def test_remove_upload(repository: Repository) -> None:
     upload = await repository.find_upload(user.uid, upload_id=upload_id)
 
     # Then
-    assert upload.uid == upload_id
-    assert upload.blob_key == blob_key
-    assert upload.created_at == created_at
-    assert upload.valid_thru == valid_thru
+    assert upload == Upload(
+        uid=upload_id,
+        blob_key=blob_key,
+        created_at=created_at,
+        valid_thru=valid_thru,
+    )
 
     # When
     await repository.remove_upload(upload_id)
@@ -372,25 +586,80 @@ async def test_remove_upload(repository: Repository) -> None:
         await repository.find_upload(user.uid, upload_id=upload_id)
 
 
-async def test_purge_uploads(repository: Repository) -> None:
+async def test_finish_upload(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
     upload_id = "upload-id"
+    blob_key = f"{user.uid}/image/{next(_uids)}.png"
+    file_name = "blob.png"
+
+    created_at = _now
+    valid_thru = created_at + _second
+
+    await repository.start_upload(
+        user.uid,
+        uid=upload_id,
+        blob_key=blob_key,
+        created_at=created_at,
+        valid_thru=valid_thru,
+    )
+
+    # When/Then
+    with pytest.raises(EntityNotFoundError):
+        await repository.finish_upload(
+            next(_uids),
+            upload_id,
+            file_name=file_name,
+            created_at=created_at,
+            valid_thru=valid_thru,
+        )
 
-    created_at = datetime.now(UTC)
-    blob_keys = [f"{user.uid}/main/{uuid4().hex}.sub" for _ in range(1, 4)]
+    # When
+    blob = await repository.finish_upload(
+        user.uid,
+        upload_id,
+        file_name=file_name,
+        created_at=created_at,
+        valid_thru=valid_thru,
+    )
+
+    # Then
+    assert await repository.find_blob(user.uid, blob_uid=blob.uid) == (
+        blob, blob_key,
+    )
+
+    with pytest.raises(EntityNotFoundError):
+        await repository.find_upload(user.uid, upload_id=upload_id)
 
-    for blob_key in blob_keys:
-        valid_thru = created_at + timedelta(seconds=1)
-        upload = await repository.start_upload(
+    # When/Then
+    with pytest.raises(EntityNotFoundError):
+        await repository.finish_upload(
             user.uid,
-            uid=upload_id,
-            blob_key=blob_key,
+            upload_id,
+            file_name=file_name,
             created_at=created_at,
             valid_thru=valid_thru,
         )
-        created_at = valid_thru
+
+
+async def test_purge_uploads(repository: Repository, user: User) -> None:
+    # Given
+    upload_id = "upload-id"
+
+    created_at = _now
+    blob_keys = [f"{user.uid}/main/{next(_uids)}.sub" for _ in range(1, 4)]
+
+    *_, upload = await repository.start_uploads(
+        user.uid,
+        [
+            dict(
+                uid=upload_id,
+                blob_key=blob_key,
+                created_at=created_at + i * _second,
+                valid_thru=created_at + (i + 1) * _second,
+            )
+            for i, blob_key in enumerate(blob_keys)
+        ],
+    )
 
     # When
     uploads = await repository.find_uploads(user.uid)
@@ -399,25 +668,41 @@ async def test_purge_uploads(repository: Repository) -> None:
     assert len(uploads) == len(blob_keys)
 
     # When
-    await repository.purge_uploads(1, upload.valid_thru + timedelta(days=2))
+    purged = []
+
+    async for purged_upload in repository.purge_uploads(
+        1, upload.valid_thru + _two_days, batch_size=1,
+    ):
+        purged.append(purged_upload)
+        uploads = await repository.find_uploads(user.uid)
+        break
+
+    # Then
+    assert len(uploads) == len(blob_keys) - 1
+
+    # When
+    purged += [
+        purged_upload
+        async for purged_upload
+        in repository.purge_uploads(1, upload.valid_thru + _two_days)
+    ]
     uploads = await repository.find_uploads(user.uid)
 
     # Then
+    assert {upload.blob_key for upload in purged} == set(blob_keys)
     assert not uploads
 
 ##############
 # compute jobs
 ##############
 
-async def test_create_job(repository: Repository) -> None:
+async def test_create_job(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
-    blob_key = f"{user.uid}/image/{uuid4().hex}.png"
+    blob_key = f"{user.uid}/image/{next(_uids)}.png"
     file_name = "blob.png"
 
-    created_at = datetime.now(UTC)
-    valid_thru = created_at + timedelta(seconds=1)
+    created_at = _now
+    valid_thru = created_at + _second
 
     blob = await repository.create_blob(
         user.uid,
@@ -428,7 +713,7 @@ async def test_create_job(repository: Repository) -> None:
     )
 
     # When
-    await repository.submit_job(blob.uid, requested_at=datetime.now(UTC))
+    await repository.submit_job(blob.uid, requested_at=_now)
     job = await repository.find_latest_job(blob.uid)
 
     # Then
@@ -442,15 +727,13 @@ async def test_create_job(repository: Repository) -> None:
     assert len(jobs) == 1
     assert jobs[0] == job
 
-async def test_find_latest_job(repository: Repository) -> None:
+async def test_find_latest_job(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
-    blob_key = f"{user.uid}/image/{uuid4().hex}.png"
+    blob_key = f"{user.uid}/image/{next(_uids)}.png"
     file_name = "blob.png"
 
-    created_at = datetime.now(UTC)
-    valid_thru = created_at + timedelta(seconds=1)
+    created_at = _now
+    valid_thru = created_at + _second
 
     blob = await repository.create_blob(
         user.uid,
@@ -465,11 +748,16 @@ async def test_find_latest_job(repository: Repository) -> None:
         await repository.find_latest_job(blob.uid)
 
     # Given
-    requested_at = datetime.now(UTC)
-
-    for _ in range(3):
-        requested_at += timedelta(seconds=1)
-        await repository.submit_job(blob.uid, requested_at=requested_at)
+    requested_at = _now + 3 * _second
+
+    await asyncio.gather(
+        *(
+            repository.submit_job(
+                blob.uid, requested_at=requested_at - i * _second,
+            )
+            for i in range(3)
+        ),
+    )
 
     # When
     job = await repository.find_latest_job(blob.uid)
@@ -477,15 +765,13 @@ async def test_find_latest_job(repository: Repository) -> None:
     # Then
     assert job.requested_at == requested_at
 
-async def test_update_job(repository: Repository) -> None:
+async def test_update_job(repository: Repository, user: User) -> None:
     # Given
-    user = await repository.register_user("ywu", "123")
-
-    blob_key = f"{user.uid}/image/{uuid4().hex}.png"
+    blob_key = f"{user.uid}/image/{next(_uids)}.png"
     file_name = "blob.png"
 
-    created_at = datetime.now(UTC)
-    valid_thru = created_at + timedelta(seconds=1)
+    created_at = _now
+    valid_thru = created_at + _second
 
     blob = await repository.create_blob(
         user.uid,
@@ -495,8 +781,8 @@ async def test_update_job(repository: Repository) -> None:
         valid_thru=valid_thru,
     )
 
-    job = await repository.submit_job(blob.uid, requested_at=datetime.now(UTC))
-    blob_key = f"{user.uid}/result/{uuid4().hex}.png"
+    job = await repository.submit_job(blob.uid, requested_at=_now)
+    blob_key = f"{user.uid}/result/{next(_uids)}.png"
 
     # When/Then
     with pytest.raises(ValueError):
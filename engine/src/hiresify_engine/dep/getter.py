@@ -5,43 +5,47 @@
 
 """Provide the getter functions for endpoint dependencies."""
 
-from fastapi import FastAPI, Request
+from operator import attrgetter
+
+from fastapi import Request
 
 from hiresify_engine.config import AppConfig
 from hiresify_engine.db.repository import Repository
 from hiresify_engine.service import BlobService, CacheService, QueueService
 
+# The accessors that resolve each app.state entry from a request in one call.
+_blob = attrgetter("app.state.blob")
+_queue = attrgetter("app.state.queue")
+_cache = attrgetter("app.state.cache")
+_config = attrgetter("app.state.config")
+_repo = attrgetter("app.state.repo")
+
 
 def get_blob(request: Request) -> BlobService:
     """Get the blob service from app.state."""
-    app: FastAPI = request.app
-    service: BlobService = app.state.blob
+    service: BlobService = _blob(request)
     return service
 
 
 def get_queue(request: Request) -> QueueService:
     """Get the job queue service from app.state."""
-    app: FastAPI = request.app
-    service: QueueService = app.state.queue
+    service: QueueService = _queue(request)
     return service
 
 
 def get_cache(request: Request) -> CacheService:
     """Get the cache service from app.state."""
-    app: FastAPI = request.app
-    service: CacheService = app.state.cache
+    service: CacheService = _cache(request)
     return service
 
 
 def get_config(request: Request) -> AppConfig:
     """Get the app configuration from app.state."""
-    app: FastAPI = request.app
-    config: AppConfig = app.state.config
+    config: AppConfig = _config(request)
     return config
 
 
 def get_repo(request: Request) -> Repository:
     """Get the database repository from app.state."""
-    app: FastAPI = request.app
-    repository: Repository = app.state.repo
+    repository: Repository = _repo(request)
     return repository
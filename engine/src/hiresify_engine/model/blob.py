@@ -14,7 +14,7 @@ from hiresify_engine.util import check_tz
 from .config import DEFAULT_CONFIG
 
 
-@dataclass(frozen=True, config=DEFAULT_CONFIG)
+@dataclass(frozen=True, config=DEFAULT_CONFIG, slots=True)
 class Blob:
     """Wrap user-facing fields and methods for a blob."""
 
@@ -5,17 +5,16 @@
 
 """Define the domain models for cache store."""
 
-import copy
 import json
 import typing as ty
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from uuid import uuid4
 
 from hiresify_engine.const import SESSION_NAME
 
 
-@dataclass(frozen=True, kw_only=True)
+@dataclass(frozen=True, kw_only=True, slots=True)
 class _BaseSession:
     """The base for a session domain model."""
 
@@ -40,13 +39,11 @@ class _BaseSession:
 
     def serialize(self) -> str:
         """Serialize this object into a string."""
-        raw = copy.deepcopy(self.__dict__)
-
-        for key, value in raw.items():
-            if isinstance(value, datetime):
-                raw[key] = value.isoformat()
-
-        return json.dumps(raw)
+        # The datetimes are the only fields that JSON cannot encode as they are.
+        return json.dumps(
+            {f.name: getattr(self, f.name) for f in fields(self)},
+            default=datetime.isoformat,
+        )
 
     def to_cookie(self, *, path: str = "/", same: str = "lax") -> dict[str, ty.Any]:
         """Convert the metadata to a cookie."""
@@ -65,7 +62,7 @@ class _BaseSession:
         )
 
 
-@dataclass(frozen=True, kw_only=True)
+@dataclass(frozen=True, kw_only=True, slots=True)
 class UserSession(_BaseSession):
     """The domain model for a user session."""
 
@@ -76,7 +73,7 @@ class UserSession(_BaseSession):
     type: ty.ClassVar[str] = "user"
 
 
-@dataclass(frozen=True, kw_only=True)
+@dataclass(frozen=True, kw_only=True, slots=True)
 class CSRFSession(_BaseSession):
     """The domain model for a CSRF session."""
 
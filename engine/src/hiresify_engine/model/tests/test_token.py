@@ -0,0 +1,66 @@
+# Copyright (c) 2025 Yifeng Wu
+# All rights reserved.
+# This file is not licensed for use, modification, or distribution without
+# explicit written permission from the copyright holder.
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from .. import token as token_module
+from ..token import JWTToken, _decode_token
+
+
+def _issue(secret_key: str) -> tuple[JWTToken, str]:
+    now = datetime.now(UTC).replace(microsecond=0)
+    jwt_token = JWTToken(
+        user_uid="ywu",
+        issued_at=now,
+        expire_at=now + timedelta(minutes=15),
+    )
+    return jwt_token, jwt_token.get_token(secret_key)
+
+
+def test_from_token_expired(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Given
+    jwt_token, token = _issue("secret")
+    assert JWTToken.from_token(token, secret_key="secret") == jwt_token
+
+    class _Later(datetime):
+        @classmethod
+        def now(cls, tz=None) -> datetime:  # type: ignore[override]
+            return datetime.now(tz) + timedelta(hours=1)
+
+    monkeypatch.setattr(token_module, "datetime", _Later)
+    hits = _decode_token.cache_info().hits
+
+    # When
+    decoded = JWTToken.from_token(token, secret_key="secret")
+
+    # Then
+    assert _decode_token.cache_info().hits == hits + 1
+    assert decoded is None
+
+
+def test_from_token_tampered() -> None:
+    # Given
+    _, token = _issue("secret")
+    tampered = f"{token[:-2]}{'B' if token[-2] == 'A' else 'A'}{token[-1]}"
+
+    # When/Then
+    assert JWTToken.from_token(tampered, secret_key="secret") is None
+
+
+def test_from_token_secret_key() -> None:
+    # Given
+    jwt_token, token = _issue("secret")
+    assert JWTToken.from_token(token, secret_key="secret") == jwt_token
+
+    misses = _decode_token.cache_info().misses
+
+    # When
+    decoded = JWTToken.from_token(token, secret_key="other")
+
+    # Then
+    assert _decode_token.cache_info().misses == misses + 1
+    assert decoded is None
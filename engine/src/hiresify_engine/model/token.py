@@ -8,6 +8,7 @@
 import typing as ty
 from dataclasses import dataclass, field
 from datetime import UTC, datetime
+from functools import lru_cache
 from uuid import uuid4
 
 from jose import JWTError, jwt
@@ -16,7 +17,7 @@ from hiresify_engine.const import TOKEN_ALGORITHM, TOKEN_AUDIENCE, TOKEN_ISSUER
 from hiresify_engine.util import check_tz
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class JWTToken:
     """Wrap user-facing fields and methods for a JWT token."""
 
@@ -47,23 +48,11 @@ class JWTToken:
     @classmethod
     def from_token(cls, token: str, *, secret_key: str) -> ty.Optional["JWTToken"]:
         """Initialize a new instance of JWTToken by decrypting the JWT token."""
-        try:
-            payload = jwt.decode(
-                token,
-                key=secret_key,
-                algorithms=[TOKEN_ALGORITHM],
-                audience=TOKEN_AUDIENCE,
-                issuer=TOKEN_ISSUER,
-            )
-        except JWTError:
-            return None
-
-        return cls(
-            issued_at=datetime.fromtimestamp(payload["iat"], tz=UTC),
-            expire_at=datetime.fromtimestamp(payload["exp"], tz=UTC),
-            uid=payload["jti"],
-            user_uid=payload["sub"],
-        )
+        # A cached token may have expired since it was first decrypted.
+        if (jwt_token := _decode_token(token, secret_key)) and jwt_token.is_valid():
+            return jwt_token
+
+        return None
 
     def get_token(self, secret_key: str) -> str:
         """Compute the JWT token by encrypting the token information."""
@@ -102,3 +91,29 @@ class JWTToken:
             secure=False,
             value=encrypted_token,
         )
+
+
+@lru_cache(maxsize=4096)
+def _decode_token(token: str, secret_key: str) -> JWTToken | None:
+    """Decrypt the JWT token, memoized on the token and the secret key.
+
+    The expiry is only checked against the time of the first call, so a cached token
+    has to be checked for expiry again on every later use.
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            key=secret_key,
+            algorithms=[TOKEN_ALGORITHM],
+            audience=TOKEN_AUDIENCE,
+            issuer=TOKEN_ISSUER,
+        )
+    except JWTError:
+        return None
+
+    return JWTToken(
+        issued_at=datetime.fromtimestamp(payload["iat"], tz=UTC),
+        expire_at=datetime.fromtimestamp(payload["exp"], tz=UTC),
+        uid=payload["jti"],
+        user_uid=payload["sub"],
+    )
@@ -129,12 +129,11 @@ async def finish_upload(
     async with blob.start_session(config.production) as session:
         await session.finish_upload(upload.blob_key, upload_id)
 
-    await repo.remove_upload(upload_id)
-
     created_at, valid_thru = get_interval_from_now(86400 * config.upload_ttl)
-    return await repo.create_blob(
+
+    return await repo.finish_upload(
         token.user_uid,
-        blob_key=upload.blob_key,
+        upload_id,
         file_name=file_name,
         created_at=created_at,
         valid_thru=valid_thru,
@@ -5,21 +5,34 @@
 
 """Export a testing version of the repository layer."""
 
-import tempfile
+import sqlite3
 import typing as ty
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, closing
+from uuid import uuid4
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from hiresify_engine.db.repository import Repository
 
 
 @asynccontextmanager
 async def test_repository() -> ty.AsyncGenerator[Repository, None]:
-    """Create a test repository in the context of a temporary database file."""
-    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db:
-        temp_db.close()
+    """Create a test repository in the context of an in-memory database.
+
+    The database is named and served by a single pooled connection, which also
+    serializes the writers that shared-cache SQLite would reject as locked. A shared
+    in-memory database is dropped with its last connection, so an idle connection
+    outside the pool keeps it and its schema alive if the pooled one is invalidated.
+    """
+    db_uri = f"file:{uuid4().hex}?mode=memory&cache=shared"
+    repository = Repository(
+        f"sqlite+aiosqlite:///{db_uri}&uri=true",
+        max_overflow=0,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+    )
 
-        db_url = f"sqlite+aiosqlite:///{temp_db.name}"
-        repository = Repository(db_url)
+    with closing(sqlite3.connect(db_uri, uri=True)):
         await repository.init_schema()
         yield repository
         await repository.dispose()
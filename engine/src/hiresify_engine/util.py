@@ -18,6 +18,9 @@ BLOB_KEY_PATTERN = re.compile(
     r"/(?P<blob_uid>[a-zA-Z0-9]{32})\.(?P<sub>[a-z0-9]+)$",
 )
 
+# The bound match of the blob key pattern, used on every blob key parsed.
+_match_blob_key = BLOB_KEY_PATTERN.match
+
 
 def abbreviate_token(token: str, cutoff: int = 6) -> str:
     """Abbreviate the given token to make it partially visible."""
@@ -64,7 +67,7 @@ def get_interval_from_now(ttl: int) -> tuple[datetime, datetime]:
 
 def parse_blob_key(blob_key: str) -> tuple[str, str, str]:
     """Parse the given blob key to get forming components."""
-    if not (match := BLOB_KEY_PATTERN.match(blob_key)):
+    if not (match := _match_blob_key(blob_key)):
         raise ValueError(f"{blob_key=} is invalid.")
 
     user_uid, main, blob_uid, sub = match.groups()